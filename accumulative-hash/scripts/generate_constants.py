@@ -7,7 +7,7 @@ import inspect
 import itertools
 import json
 import random
-from decimal import Decimal, getcontext
+from math import isqrt
 from typing import Protocol, TYPE_CHECKING
 
 import argparse
@@ -15,9 +15,6 @@ import argparse
 RNG_SEED = 42
 random.seed(RNG_SEED)
 
-# Set decimal precision high enough for our calculations
-getcontext().prec = 100
-
 if TYPE_CHECKING:
     from typing import Generator, TypedDict, Literal
 
@@ -34,10 +31,11 @@ if TYPE_CHECKING:
 
 def prime_factory() -> "Generator[int, None, None]":
     """
-    Simple, inefficient prime number generator.
+    Segmented Sieve of Eratosthenes prime number generator.
 
-    Realistically for our purpose, we are only generating a few of them
-    so efficiency is not a concern.
+    The first segment ``[0, 1024)`` is sieved directly; whenever a segment is
+    exhausted, the bound is doubled and only the new segment
+    ``[limit, 2 * limit)`` is sieved, using the base primes found so far.
 
     Examples
     --------
@@ -47,23 +45,64 @@ def prime_factory() -> "Generator[int, None, None]":
         >>> [next(primes) for _ in range(10)]
         [2, 3, 5, 7, 11, 13, 17, 19, 23, 29]
 
+    The 200th and 1000th primes, from the second and fourth segments respectively:
+
+        >>> primes = list(itertools.islice(prime_factory(), 1000))
+        >>> primes[199], primes[999]
+        (1223, 7919)
+
     """
-    found = [2]
+    limit = 1024
+    sieve = bytearray(b"\x01") * limit
+    sieve[0] = sieve[1] = 0
+    for i in range(2, int(limit**0.5) + 1):
+        if sieve[i]:
+            sieve[i * i :: i] = bytes(len(sieve[i * i :: i]))
 
-    yield found[-1]
-    candidate = found[-1]
+    base_primes = [k for k, is_prime in enumerate(sieve) if is_prime]
+    yield from base_primes
 
     while True:
-        candidate += 1
+        low, limit = limit, limit * 2
+        segment = bytearray(b"\x01") * (limit - low)
 
-        for prime in found:
-            if prime * prime > candidate:
-                found.append(candidate)
-                yield candidate
+        for prime in base_primes:
+            if prime * prime >= limit:
                 break
 
-            if candidate % prime == 0:
-                break
+            # First multiple of ``prime`` within the segment, no less than ``prime^2``
+            start = max(prime * prime, -(-low // prime) * prime) - low
+            segment[start::prime] = bytes(len(segment[start::prime]))
+
+        found = [low + k for k, is_prime in enumerate(segment) if is_prime]
+        base_primes.extend(found)
+        yield from found
+
+
+# Primes found so far, shared by every ``cached_primes`` iterator
+_PRIME_CACHE: "list[int]" = []
+_PRIME_SOURCE = prime_factory()
+
+
+def cached_primes() -> "Generator[int, None, None]":
+    """
+    Iterate over the primes in order, sharing the ones already found with all other
+    iterators so that no prime is generated twice.
+
+    Examples
+    --------
+        >>> primes = cached_primes()
+        >>> [next(primes) for _ in range(5)]
+        [2, 3, 5, 7, 11]
+        >>> next(cached_primes())
+        2
+
+    """
+    for index in itertools.count():
+        if index == len(_PRIME_CACHE):
+            _PRIME_CACHE.append(next(_PRIME_SOURCE))
+
+        yield _PRIME_CACHE[index]
 
 
 class ParsedArgs(Protocol):
@@ -104,19 +143,19 @@ def golden_ratio_constant(n: int) -> int:
     Return ``floor(2^n / φ) = floor(2^n * (sqrt(5) - 1) / 2)``
     where ``φ`` is the golden ratio.
 
-    Valid for n up to at least 128 bits; beyond that, precision issues may arise,
-    further testing needed.
+    This is computed exactly in integer arithmetic as
+    ``(isqrt(5 * 4^n) - 2^n) // 2``, so there is no precision limit on ``n``.
 
-    This is typically a non-issue since C does not support integer types larger than 128
-    bits.
-    """
-    if not (0 <= n <= 128):
-        raise ValueError("n must be between 0 and 128")
+    Examples
+    --------
+        >>> hex(golden_ratio_constant(64))
+        '0x9e3779b97f4a7c15'
 
-    sqrt5 = Decimal(5).sqrt()
-    inv_phi = (sqrt5 - 1) / 2
+    """
+    if n < 0:
+        raise ValueError("n must be non-negative")
 
-    return int((Decimal(2) ** n) * inv_phi)
+    return (isqrt(5 << (2 * n)) - (1 << n)) // 2
 
 
 def constant_from_prime(prime: int, bits: int) -> int:
@@ -124,7 +163,8 @@ def constant_from_prime(prime: int, bits: int) -> int:
     Generate a constant from a prime number suitable for accumulative hashing.
 
     The constant is derived by the first ``N`` bits of the fractional parts of the
-    square roots of the primes.
+    square roots of the primes, i.e. the lowest ``N`` bits of
+    ``floor(sqrt(prime) * 2^N) = isqrt(prime * 4^N)``.
 
     Parameters
     ----------
@@ -138,11 +178,14 @@ def constant_from_prime(prime: int, bits: int) -> int:
     -------
     int
         The generated constant.
+
+    Examples
+    --------
+        >>> hex(constant_from_prime(2, 32))
+        '0x6a09e667'
+
     """
-    sqrt_prime = Decimal(prime).sqrt()
-    fractional_part = sqrt_prime - int(sqrt_prime)
-    constant = int(fractional_part * (Decimal(2) ** bits))
-    return constant
+    return isqrt(prime << (2 * bits)) & ((1 << bits) - 1)
 
 
 def generate_constants(
@@ -163,7 +206,7 @@ def generate_constants(
         The next constant suitable for use as a multiplier.
     """
 
-    primes = prime_factory()
+    primes = cached_primes()
     while True:
         prime = next(primes)
         constant = constant_from_prime(prime, bits)
@@ -188,7 +231,7 @@ def generate_shifts(
     int
         The next shift constant.
     """
-    primes = prime_factory()
+    primes = cached_primes()
     # Don't over shift -- limit to bits // 4
     random_shifts = [next(primes) % (bits // 2) for _ in range(shift_count)]
     random.shuffle(random_shifts)
@@ -253,6 +296,22 @@ def generate_constant_set(
     }
 
 
+# Template for ``print_rust``, dedented once at import rather than on every call
+RUST_TEMPLATE = inspect.cleandoc(
+    """
+    /// Implementation of [`IsAccumulativeHashType`] for [`u{bits}`].
+    /// 
+    /// This implementation uses constants generated by the script
+    /// ``scripts/generate_constants.py --bits {bits} --output rust```.
+    impl IsAccumulativeHashType for u{bits} {{
+        const SEED: Self = {seed};
+        const SHIFT_CONSTANTS: [Self; {shift_count}] = [{shifts}];
+        const MULTIPLIER_CONSTANTS: [Self; {multiplier_count}] = [{multipliers}];
+    }}
+    """
+)
+
+
 def print_rust(constant_set: "ConstantSet") -> str:
     """
     Print the constant set in Rust format.
@@ -268,21 +327,7 @@ def print_rust(constant_set: "ConstantSet") -> str:
             file=sys.stderr,
         )
 
-    template = inspect.cleandoc(
-        """
-        /// Implementation of [`IsAccumulativeHashType`] for [`u{bits}`].
-        /// 
-        /// This implementation uses constants generated by the script
-        /// ``scripts/generate_constants.py --bits {bits} --output rust```.
-        impl IsAccumulativeHashType for u{bits} {{
-            const SEED: Self = {seed};
-            const SHIFT_CONSTANTS: [Self; {shift_count}] = [{shifts}];
-            const MULTIPLIER_CONSTANTS: [Self; {multiplier_count}] = [{multipliers}];
-        }}
-        """
-    )
-
-    return template.format(
+    return RUST_TEMPLATE.format(
         bits=constant_set["bits"],
         seed=constant_set["seed"],
         shift_count=len(constant_set["shiftConstants"]),
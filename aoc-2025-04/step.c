@@ -0,0 +1,50 @@
+#include <stddef.h>
+#include <stdint.h>
+#include <stdlib.h>
+
+#define STOCK 1
+#define REMOVED -1
+
+/// One round of counting the stocks in the 8 adjacent cells, and removing the stocks
+/// with fewer than `threshold` of them.
+///
+/// `warehouse` is a C-contiguous `height` x `width` array of `CellState`s. Returns the
+/// number of stocks removed, or `SIZE_MAX` if the working buffer cannot be allocated.
+size_t step(int8_t *warehouse, size_t height, size_t width, int threshold) {
+    const size_t padded_width = width + 2;
+
+    // Stock mask with a border of empty cells, taken before any removals so that the
+    // whole round sees the same warehouse.
+    uint8_t *padded = calloc((height + 2) * padded_width, sizeof(uint8_t));
+    if (padded == NULL) {
+        return SIZE_MAX;
+    }
+
+    for (size_t y = 0; y < height; y++) {
+        const int8_t *row = warehouse + y * width;
+        uint8_t *padded_row = padded + (y + 1) * padded_width + 1;
+        for (size_t x = 0; x < width; x++) {
+            padded_row[x] = row[x] == STOCK;
+        }
+    }
+
+    size_t removed = 0;
+    for (size_t y = 0; y < height; y++) {
+        int8_t *row = warehouse + y * width;
+        const uint8_t *above = padded + y * padded_width;
+        const uint8_t *centre = above + padded_width;
+        const uint8_t *below = centre + padded_width;
+
+        // Fixed offsets with no branches, so that the compiler can vectorise this
+        for (size_t x = 0; x < width; x++) {
+            uint8_t count = above[x] + above[x + 1] + above[x + 2] + centre[x] +
+                            centre[x + 2] + below[x] + below[x + 1] + below[x + 2];
+            uint8_t remove = centre[x + 1] & (count < threshold);
+            row[x] = remove ? REMOVED : row[x];
+            removed += remove;
+        }
+    }
+
+    free(padded);
+    return removed;
+}
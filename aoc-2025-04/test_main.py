@@ -1,17 +1,35 @@
+import ctypes
+import functools
 import numpy as np
 import time as timer
 import numpy.typing as npt
 import pytest
-import itertools
 from pathlib import Path
+from numba import njit
 
 from enum import IntEnum
 
 Warehouse = npt.NDArray[np.int8]
 Counter = npt.NDArray[np.uint8]
+StockMask = npt.NDArray[np.bool_]
+Bitboard = npt.NDArray[np.uint64]
 
 Slice = slice  # We will only use slices with step=None
 
+RNG_SEED = 42
+
+# (dy, dx) of the 8 adjacent cells
+NEIGHBOUR_OFFSETS = (
+    (-1, -1),
+    (-1, 0),
+    (-1, 1),
+    (0, -1),
+    (0, 1),
+    (1, -1),
+    (1, 0),
+    (1, 1),
+)
+
 
 class CellState(IntEnum):
     EMPTY = 0
@@ -32,42 +50,56 @@ def bounded(value: int, min_value: int, max_value: int) -> int:
     return max(min_value, min(value, max_value))
 
 
+# Lookup table from the ASCII bytes of the map to ``CellState``; any byte not in the
+# map is set to ``INVALID_CELL`` so that it can be rejected after the lookup.
+INVALID_CELL = 127
+CHAR_TO_CELL = np.full(256, INVALID_CELL, dtype=np.int8)
+CHAR_TO_CELL[ord("@")] = CellState.STOCK
+CHAR_TO_CELL[ord(".")] = CellState.EMPTY
+CHAR_TO_CELL[ord("x")] = CellState.REMOVED
+
+# Inverse lookup table, indexed by the ``uint8`` view of a ``CellState``; ``0`` marks
+# an invalid cell state.
+CELL_TO_CHAR = np.zeros(256, dtype=np.uint8)
+CELL_TO_CHAR[CellState.STOCK & 0xFF] = ord("@")
+CELL_TO_CHAR[CellState.EMPTY & 0xFF] = ord(".")
+CELL_TO_CHAR[CellState.REMOVED & 0xFF] = ord("x")
+
+
 def text_to_warehouse(text: str) -> Warehouse:
-    lines = text.strip().splitlines()
+    lines = [line.strip() for line in text.strip().splitlines()]
     height = len(lines)
     width = len(lines[0])
-    warehouse = np.zeros((height, width), dtype=np.int8)
-    for y, line in enumerate(lines):
-        line = line.strip()
-        for x, char in enumerate(line):
-            if char == "@":
-                warehouse[y, x] = CellState.STOCK
-            elif char == ".":
-                warehouse[y, x] = CellState.EMPTY
-            elif char == "x":
-                warehouse[y, x] = CellState.REMOVED
-            else:
-                raise ValueError(f"Unexpected character in warehouse map: {char}")
+    if any(len(line) != width for line in lines):
+        raise ValueError("Warehouse map is not rectangular")
+
+    try:
+        encoded = "".join(lines).encode("ascii")
+    except UnicodeEncodeError as error:
+        char = error.object[error.start]
+        raise ValueError(f"Unexpected character in warehouse map: {char}") from error
+
+    chars = np.frombuffer(encoded, dtype=np.uint8).reshape(height, width)
+    warehouse: Warehouse = CHAR_TO_CELL[chars]
+    if (invalid := warehouse == INVALID_CELL).any():
+        char = chr(chars[invalid][0])
+        raise ValueError(f"Unexpected character in warehouse map: {char}")
     return warehouse
 
 
 def warehouse_to_text(warehouse: Warehouse) -> str:
-    lines = []
     height, width = warehouse.shape
-    for y in range(height):
-        line_chars = []
-        for x in range(width):
-            cell = warehouse[y, x]
-            if cell == CellState.STOCK:
-                line_chars.append("@")
-            elif cell == CellState.EMPTY:
-                line_chars.append(".")
-            elif cell == CellState.REMOVED:
-                line_chars.append("x")
-            else:
-                raise ValueError(f"Unexpected cell state in warehouse: {cell}")
-        lines.append("".join(line_chars))
-    return "\n".join(lines)
+    # Values that do not survive the cast to ``int8`` cannot be a ``CellState``
+    cells = warehouse.astype(np.int8, copy=False)
+    if cells is not warehouse and (changed := cells != warehouse).any():
+        raise ValueError(f"Unexpected cell state in warehouse: {warehouse[changed][0]}")
+
+    chars = np.full((height, width + 1), ord("\n"), dtype=np.uint8)
+    chars[:, :width] = CELL_TO_CHAR[cells.view(np.uint8)]
+    if (invalid := chars == 0).any():
+        cell = warehouse[invalid[:, :width]][0]
+        raise ValueError(f"Unexpected cell state in warehouse: {cell}")
+    return chars.tobytes()[:-1].decode("ascii")
 
 
 def shifted_index(
@@ -122,16 +154,40 @@ def add_stock_to_counter(
     counter[counter_index] += warehouse[warehouse_index] == CellState.STOCK
 
 
+def stock_mask(warehouse: Warehouse) -> StockMask:
+    return warehouse == CellState.STOCK
+
+
 def count_adjacent_stocks(
     warehouse: Warehouse,
+    *,
+    is_stock: StockMask | None = None,
+    out: Counter | None = None,
 ) -> Counter:
+    # ``is_stock`` can be passed in to share one ``stock_mask`` with ``remove_stocks``,
+    # and ``out`` to reuse the same counter across rounds instead of allocating one.
+    if is_stock is None:
+        is_stock = stock_mask(warehouse)
+
     height, width = warehouse.shape
-    counter: Counter = np.zeros((height, width), dtype=np.uint8)
 
-    for x, y in itertools.product((-1, 0, 1), repeat=2):
-        if x == 0 and y == 0:
-            continue
-        add_stock_to_counter(warehouse, counter, x=x, y=y)
+    # Pad the stock mask with a border of empty cells, so that every one of the 8
+    # shifted views is the same shape as the warehouse and no edge handling is needed.
+    # See the README for why this is not ``scipy.ndimage.convolve``; ``uint8`` holds
+    # counts up to 8 with the least memory traffic of any dtype.
+    padded = np.zeros((height + 2, width + 2), dtype=np.uint8)
+    padded[1:-1, 1:-1] = is_stock
+
+    # Accumulate in place, so none of the 8 adds allocates a temporary
+    counter: Counter = np.empty((height, width), dtype=np.uint8) if out is None else out
+    np.copyto(counter, padded[:-2, :-2])
+    counter += padded[:-2, 1:-1]
+    counter += padded[:-2, 2:]
+    counter += padded[1:-1, :-2]
+    counter += padded[1:-1, 2:]
+    counter += padded[2:, :-2]
+    counter += padded[2:, 1:-1]
+    counter += padded[2:, 2:]
 
     return counter
 
@@ -140,11 +196,211 @@ def remove_stocks(
     warehouse: Warehouse,
     counter: Counter,
     *,
+    is_stock: StockMask | None = None,
     threshold: int = 4,
 ) -> int:
-    to_remove = (warehouse == CellState.STOCK) & (counter < threshold)
-    warehouse[to_remove] = CellState.REMOVED
-    return np.sum(to_remove)
+    if is_stock is None:
+        is_stock = stock_mask(warehouse)
+
+    to_remove = is_stock & (counter < threshold)
+    removed = int(np.count_nonzero(to_remove))
+    np.putmask(warehouse, to_remove, CellState.REMOVED)
+    return removed
+
+
+@njit(cache=True)
+def step(
+    warehouse: Warehouse,
+    threshold: int = 4,
+) -> int:
+    # One round of ``count_adjacent_stocks`` followed by ``remove_stocks``, compiled
+    # into a single loop. Counts are taken from a padded snapshot of the stock mask,
+    # so that every cell in the round sees the same warehouse, and no neighbour needs
+    # a bounds check.
+    height, width = warehouse.shape
+    padded = np.zeros((height + 2, width + 2), dtype=np.uint8)
+    for y in range(height):
+        for x in range(width):
+            padded[y + 1, x + 1] = warehouse[y, x] == CellState.STOCK
+
+    removed = 0
+    for y in range(height):
+        for x in range(width):
+            if not padded[y + 1, x + 1]:
+                continue
+
+            count = 0
+            for dy, dx in NEIGHBOUR_OFFSETS:
+                count += padded[y + 1 + dy, x + 1 + dx]
+
+            if count < threshold:
+                warehouse[y, x] = CellState.REMOVED
+                removed += 1
+
+    return removed
+
+
+STEP_LIBRARY_PATH = Path(__file__).parent / "libstep.so"
+
+
+@functools.cache
+def load_step_library() -> ctypes.CDLL:
+    # Ahead-of-time compiled ``step``, built from ``step.c`` by ``make``
+    if not STEP_LIBRARY_PATH.exists():
+        raise FileNotFoundError(
+            f"{STEP_LIBRARY_PATH} not found; run `make` to build it"
+        )
+
+    library = ctypes.CDLL(str(STEP_LIBRARY_PATH))
+    library.step.argtypes = [
+        np.ctypeslib.ndpointer(dtype=np.int8, ndim=2, flags="C_CONTIGUOUS"),
+        ctypes.c_size_t,
+        ctypes.c_size_t,
+        ctypes.c_int,
+    ]
+    library.step.restype = ctypes.c_size_t
+    return library
+
+
+def aot_step(
+    warehouse: Warehouse,
+    threshold: int = 4,
+) -> int:
+    # Same as ``step``, but without the JIT warm-up
+    height, width = warehouse.shape
+    removed = load_step_library().step(warehouse, height, width, threshold)
+    if removed == ctypes.c_size_t(-1).value:
+        raise MemoryError("Could not allocate the stock mask for the warehouse")
+    return removed
+
+
+# Bitboards hold 64 cells per word, with cell ``x`` of a row at bit ``x % 64`` of
+# word ``x // 64 + 1``; a border of empty words/rows surrounds the warehouse.
+WORD_BITS = 64
+ONE = np.uint64(1)
+ALL_BITS = np.uint64(0xFFFF_FFFF_FFFF_FFFF)
+
+
+@njit(cache=True)
+def pack_stocks(warehouse: Warehouse) -> Bitboard:
+    height, width = warehouse.shape
+    words = (width + WORD_BITS - 1) // WORD_BITS
+    bits = np.zeros((height + 2, words + 2), dtype=np.uint64)
+
+    for y in range(height):
+        for x in range(width):
+            if warehouse[y, x] == CellState.STOCK:
+                bits[y + 1, x // WORD_BITS + 1] |= ONE << np.uint64(x % WORD_BITS)
+
+    return bits
+
+
+@njit(cache=True)
+def below_threshold(
+    s0: np.uint64,
+    s1: np.uint64,
+    s2: np.uint64,
+    s3: np.uint64,
+    threshold: int,
+) -> np.uint64:
+    # Bit-sliced ``count < threshold``, where bit ``i`` of the count is in ``s{i}``
+    if threshold <= 0:
+        return np.uint64(0)
+    if threshold >= 16:
+        return ALL_BITS
+
+    below = np.uint64(0)
+    equal = ALL_BITS
+    for bit, plane in ((3, s3), (2, s2), (1, s1), (0, s0)):
+        if (threshold >> bit) & 1:
+            below |= equal & ~plane
+            equal &= plane
+        else:
+            equal &= ~plane
+
+    return below
+
+
+@njit(cache=True)
+def stabilize(
+    warehouse: Warehouse,
+    threshold: int = 4,
+) -> tuple[int, int]:
+    # Repeat ``step`` until no more stocks are removed, returning the number of
+    # rounds that removed anything and the total removed.
+    #
+    # The stocks are packed into a bitboard once, and each word's 8 neighbour counts
+    # are summed into 4 bit planes by ripple-carry adders, so every operation works
+    # on 64 cells at a time.
+    #
+    # After the first round, only the words next to a word that had removals in the
+    # previous round can change, so only those ``dirty`` words are counted again.
+    height, width = warehouse.shape
+    bits = pack_stocks(warehouse)
+    words = bits.shape[1] - 2
+    removals = np.zeros_like(bits)
+    dirty = np.ones(bits.shape, dtype=np.bool_)
+    neighbours = np.empty(8, dtype=np.uint64)
+
+    rounds = 0
+    total_removed = 0
+    while True:
+        removed = 0
+        for y in range(1, height + 1):
+            for w in range(1, words + 1):
+                if not dirty[y, w]:
+                    continue
+
+                i = 0
+                for r in range(y - 1, y + 2):
+                    centre = bits[r, w]
+                    # Cells carried over from the adjacent words
+                    west_carry = bits[r, w - 1] >> np.uint64(WORD_BITS - 1)
+                    east_carry = bits[r, w + 1] << np.uint64(WORD_BITS - 1)
+                    neighbours[i] = (centre << ONE) | west_carry
+                    neighbours[i + 1] = (centre >> ONE) | east_carry
+                    i += 2
+                    if r != y:
+                        neighbours[i] = centre
+                        i += 1
+
+                s0 = s1 = s2 = s3 = np.uint64(0)
+                for carry in neighbours:
+                    s0 ^= carry
+                    carry &= ~s0
+                    s1 ^= carry
+                    carry &= ~s1
+                    s2 ^= carry
+                    carry &= ~s2
+                    s3 ^= carry
+
+                mask = bits[y, w] & below_threshold(s0, s1, s2, s3, threshold)
+                removals[y, w] = mask
+
+                x = (w - 1) * WORD_BITS
+                while mask:
+                    if mask & ONE:
+                        warehouse[y - 1, x] = CellState.REMOVED
+                        removed += 1
+                    mask >>= ONE
+                    x += 1
+
+        if removed == 0:
+            break
+
+        # Only apply the removals after the whole round is counted
+        dirty[:] = False
+        for y in range(1, height + 1):
+            for w in range(1, words + 1):
+                if removals[y, w]:
+                    bits[y, w] &= ~removals[y, w]
+                    removals[y, w] = 0
+                    dirty[y - 1 : y + 2, w - 1 : w + 2] = True
+
+        rounds += 1
+        total_removed += removed
+
+    return rounds, total_removed
 
 
 @pytest.mark.parametrize(
@@ -342,6 +598,56 @@ def test_add_stock_to_counter(
     np.testing.assert_array_equal(input_counter, expected_counter)
 
 
+@pytest.mark.parametrize(
+    ("text", "message"),
+    [
+        pytest.param(
+            "@.@\n.y.",
+            "Unexpected character in warehouse map: y",
+            id="unknown",
+        ),
+        pytest.param(
+            "@.@\n.é.",
+            "Unexpected character in warehouse map: é",
+            id="non-ascii",
+        ),
+        pytest.param(
+            "@@@@\n@@@\n@@@@@",
+            "Warehouse map is not rectangular",
+            id="ragged",
+        ),
+    ],
+)
+def test_text_to_warehouse_invalid(text: str, message: str):
+    with pytest.raises(ValueError, match=message):
+        text_to_warehouse(text)
+
+
+@pytest.mark.parametrize(
+    ("warehouse", "message"),
+    [
+        pytest.param(
+            np.array([[1, 2]], dtype=np.int8),
+            "Unexpected cell state in warehouse: 2",
+            id="int8",
+        ),
+        pytest.param(
+            np.array([[1, 257]], dtype=np.int64),
+            "Unexpected cell state in warehouse: 257",
+            id="int64 out of range",
+        ),
+    ],
+)
+def test_warehouse_to_text_invalid(warehouse: Warehouse, message: str):
+    with pytest.raises(ValueError, match=message):
+        warehouse_to_text(warehouse)
+
+
+def test_warehouse_to_text_int64():
+    warehouse = np.array([[1, 0], [-1, 1]], dtype=np.int64)
+    assert warehouse_to_text(warehouse) == "@.\nx@"
+
+
 def test_count_adjacent_stocks():
     warehouse = text_to_warehouse(
         """
@@ -384,24 +690,135 @@ x.x.@@@.x.
     )
 
 
+def assert_step_matches_numpy(warehouse: Warehouse, threshold: int):
+    expected_warehouse = warehouse.copy()
+
+    # Compare against the NumPy implementation until the warehouse stabilizes
+    counter = np.empty(warehouse.shape, dtype=np.uint8)
+    while True:
+        removed = step(warehouse, threshold=threshold)
+        is_stock = stock_mask(expected_warehouse)
+        expected_removed = remove_stocks(
+            expected_warehouse,
+            count_adjacent_stocks(expected_warehouse, is_stock=is_stock, out=counter),
+            is_stock=is_stock,
+            threshold=threshold,
+        )
+        assert removed == expected_removed
+        np.testing.assert_array_equal(warehouse, expected_warehouse)
+        if removed == 0:
+            break
+
+
+def test_step_example():
+    warehouse = text_to_warehouse(
+        """
+        ..@@.@@@@.
+        @@@.@.@.@@
+        @@@@@.@.@@
+        @.@@@@..@.
+        @@.@@@@.@@
+        .@@@@@@@.@
+        .@.@.@.@@@
+        @.@@@.@@@@
+        .@@@@@@@@.
+        @.@.@@@.@.
+        """
+    )
+    assert_step_matches_numpy(warehouse, threshold=4)
+    assert (warehouse == CellState.REMOVED).sum() == 43
+
+
+@pytest.mark.parametrize("threshold", [-1, 0, 1, 4, 8, 9, 16])
+@pytest.mark.parametrize(
+    "shape",
+    [
+        pytest.param((1, 1), id="1x1"),
+        pytest.param((10, 10), id="10x10"),
+        pytest.param((5, 64), id="5x64"),
+        pytest.param((40, 130), id="40x130"),
+    ],
+)
+def test_step(shape: tuple[int, int], threshold: int):
+    rng = np.random.default_rng(RNG_SEED)
+    warehouse: Warehouse = rng.integers(-1, 2, size=shape, dtype=np.int8)
+    assert_step_matches_numpy(warehouse, threshold=threshold)
+
+
+@pytest.mark.skipif(
+    not STEP_LIBRARY_PATH.exists(),
+    reason=f"{STEP_LIBRARY_PATH.name} is not built; run `make`",
+)
+@pytest.mark.parametrize("threshold", [0, 1, 4, 8, 9])
+@pytest.mark.parametrize("shape", [(1, 1), (10, 10), (40, 130)])
+def test_aot_step(shape: tuple[int, int], threshold: int):
+    rng = np.random.default_rng(RNG_SEED)
+    warehouse: Warehouse = rng.integers(-1, 2, size=shape, dtype=np.int8)
+    expected_warehouse = warehouse.copy()
+
+    while removed := aot_step(warehouse, threshold=threshold):
+        assert removed == step(expected_warehouse, threshold=threshold)
+        np.testing.assert_array_equal(warehouse, expected_warehouse)
+
+    assert step(expected_warehouse, threshold=threshold) == 0
+
+
+@pytest.mark.parametrize("threshold", [-1, 0, 1, 4, 8, 9, 16])
+@pytest.mark.parametrize(
+    "shape",
+    [
+        pytest.param((1, 1), id="1x1"),
+        pytest.param((10, 10), id="10x10"),
+        pytest.param((5, 64), id="5x64"),
+        pytest.param((40, 130), id="40x130"),
+    ],
+)
+def test_stabilize(shape: tuple[int, int], threshold: int):
+    rng = np.random.default_rng(RNG_SEED)
+    warehouse: Warehouse = rng.integers(-1, 2, size=shape, dtype=np.int8)
+    expected_warehouse = warehouse.copy()
+
+    expected_rounds = 0
+    expected_total_removed = 0
+    while removed := step(expected_warehouse, threshold=threshold):
+        expected_rounds += 1
+        expected_total_removed += removed
+
+    rounds, total_removed = stabilize(warehouse, threshold=threshold)
+    assert rounds == expected_rounds
+    assert total_removed == expected_total_removed
+    np.testing.assert_array_equal(warehouse, expected_warehouse)
+
+
 if __name__ == "__main__":
     input_text = get_input()
     warehouse = text_to_warehouse(input_text)
 
-    rounds = 0
-    total_removed = 0
+    # Compile (or load from cache) ``stabilize`` before timing it
+    stabilize(warehouse.copy(), threshold=4)
+
     start = timer.perf_counter_ns()
-    while True:
-        counter = count_adjacent_stocks(warehouse)
-        removed = remove_stocks(warehouse, counter, threshold=4)
-        if removed == 0:
-            break
-        total_removed += removed
-        rounds += 1
-        # print(f"After round {rounds:,}, removed {removed:,} stocks.")
+    rounds, total_removed = stabilize(warehouse, threshold=4)
 
     end = timer.perf_counter_ns()
     print(
         f"Stabilized after {rounds:,} rounds, total stocks removed: {total_removed:,}"
     )
     print(f"Execution time: {(end - start) / 1_000_000:.2f} ms")
+
+    if STEP_LIBRARY_PATH.exists():
+        warehouse = text_to_warehouse(input_text)
+
+        rounds = 0
+        total_removed = 0
+        start = timer.perf_counter_ns()
+        while removed := aot_step(warehouse, threshold=4):
+            total_removed += removed
+            rounds += 1
+
+        end = timer.perf_counter_ns()
+        print(
+            f"Ahead-of-time step stabilized after {rounds:,} rounds, "
+            f"total stocks removed: {total_removed:,}"
+        )
+        print(f"Execution time: {(end - start) / 1_000_000:.2f} ms")